@@ -1,35 +1,154 @@
 """
 Configuration settings for the Personal Knowledge Management System.
+
+Values that come from the environment are read once per process through
+get_settings(); the remaining constants are fixed defaults.
 """
 import os
+import functools
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+# Set once the .env file has been parsed; inherited by child processes
+_DOTENV_LOADED_FLAG = "PKM_DOTENV_LOADED"
+
+# HNSW parameter ranges accepted by Azure AI Search
+HNSW_M_RANGE = (4, 10)
+HNSW_EF_RANGE = (100, 1000)
+
+def _load_env() -> Dict[str, str]:
+    """
+    Load the .env file and take a snapshot of the environment.
+
+    Returns:
+        Copy of the process environment
+    """
+    # Worker processes inherit the parent's already-populated environment,
+    # so only the first process in the tree parses the .env file
+    if not os.environ.get(_DOTENV_LOADED_FLAG):
+        load_dotenv(override=False)
+        os.environ[_DOTENV_LOADED_FLAG] = "1"
+    return dict(os.environ)
+
+@dataclass(frozen=True)
+class Settings:
+    """Settings read from the environment."""
+
+    # Azure Blob Storage settings
+    azure_storage_connection_string: Optional[str]
+    blob_container_name: str
+
+    # Azure AI Search settings
+    azure_search_endpoint: Optional[str]
+    azure_search_key: Optional[str]
+    azure_search_index_name: str
+
+    # Azure OpenAI settings
+    azure_openai_endpoint: Optional[str]
+    azure_openai_key: Optional[str]
+    azure_openai_deployment: Optional[str]
+    azure_openai_api_version: str
+    azure_openai_embedding_deployment: Optional[str]
+
+    # Embedding settings
+    embedding_batch_size: int  # Max inputs per embeddings request
+    embedding_max_batch_tokens: int  # Token budget per embeddings request
+    embedding_max_concurrency: int  # Embedding requests in flight at once
+    embedding_requests_per_minute: int  # Request rate limit of the embedding deployment
+    embedding_cache_path: str  # SQLite file persisting embeddings between runs
 
-# Azure Blob Storage settings
-AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-BLOB_CONTAINER_NAME = os.getenv("BLOB_CONTAINER_NAME", "documents")
+    # Vector index settings
+    hnsw_m: int  # Bi-directional links per node
+    hnsw_ef_construction: int  # Candidate list size while building the graph
+    hnsw_ef_search: int  # Candidate list size at query time
 
-# Azure AI Search settings
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
-AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
-AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME", "knowledge-index")
+    # Ingestion settings
+    ingest_workers: int
+    ingest_stage_timeout: Optional[float]  # Seconds to wait for each of the load and upload stages; not a hard limit
 
-# Azure OpenAI settings
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
-AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2023-07-01-preview")
-AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+def _check_range(name: str, value: int, valid_range: Tuple[int, int]) -> None:
+    """
+    Check that a setting lies within the range the service accepts.
+
+    Args:
+        name: Environment variable the value came from
+        value: Configured value
+        valid_range: Inclusive lower and upper bound
+
+    Raises:
+        ValueError: If the value is out of range
+    """
+    low, high = valid_range
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}, got {value}")
+
+@functools.lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Get the settings for this process.
+
+    Returns:
+        Settings built from the environment and the .env file
+
+    Raises:
+        ValueError: If a setting is outside the range Azure accepts
+    """
+    env = _load_env()
+
+    settings = Settings(
+        azure_storage_connection_string=env.get("AZURE_STORAGE_CONNECTION_STRING"),
+        blob_container_name=env.get("BLOB_CONTAINER_NAME", "documents"),
+        azure_search_endpoint=env.get("AZURE_SEARCH_ENDPOINT"),
+        azure_search_key=env.get("AZURE_SEARCH_KEY"),
+        azure_search_index_name=env.get("AZURE_SEARCH_INDEX_NAME", "knowledge-index"),
+        azure_openai_endpoint=env.get("AZURE_OPENAI_ENDPOINT"),
+        azure_openai_key=env.get("AZURE_OPENAI_KEY"),
+        azure_openai_deployment=env.get("AZURE_OPENAI_DEPLOYMENT"),
+        azure_openai_api_version=env.get("AZURE_OPENAI_API_VERSION", "2023-07-01-preview"),
+        azure_openai_embedding_deployment=env.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT"),
+        embedding_batch_size=int(env.get("EMBEDDING_BATCH_SIZE", "2048")),
+        embedding_max_batch_tokens=int(env.get("EMBEDDING_MAX_BATCH_TOKENS", "7500")),
+        embedding_max_concurrency=int(env.get("EMBEDDING_MAX_CONCURRENCY", "8")),
+        embedding_requests_per_minute=int(env.get("EMBEDDING_REQUESTS_PER_MINUTE", "720")),
+        embedding_cache_path=env.get("EMBEDDING_CACHE_PATH", os.path.join("data", "embeddings.db")),
+        hnsw_m=int(env.get("HNSW_M", "10")),
+        hnsw_ef_construction=int(env.get("HNSW_EF_CONSTRUCTION", "200")),
+        hnsw_ef_search=int(env.get("HNSW_EF_SEARCH", "100")),
+        ingest_workers=int(env.get("INGEST_WORKERS", os.cpu_count() or 4)),
+        ingest_stage_timeout=float(env["INGEST_STAGE_TIMEOUT"]) if env.get("INGEST_STAGE_TIMEOUT") else None
+    )
+
+    # Out-of-range HNSW parameters are rejected by the service when the index
+    # is created, so fail before any work is done
+    _check_range("HNSW_M", settings.hnsw_m, HNSW_M_RANGE)
+    _check_range("HNSW_EF_CONSTRUCTION", settings.hnsw_ef_construction, HNSW_EF_RANGE)
+    _check_range("HNSW_EF_SEARCH", settings.hnsw_ef_search, HNSW_EF_RANGE)
+
+    return settings
 
 # Text processing settings
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+PARALLEL_CHUNKING_MIN_CHARS = 1_000_000  # Total text below which documents are chunked in-process
 EMBEDDING_DIMENSION = 1536  # Dimension of Azure OpenAI embeddings
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # Search query embeddings kept in memory
+EMBEDDING_WINDOW_SIZE = 1024  # Chunks embedded per call when streaming chunks to the index
+EMBEDDING_RETRY_ATTEMPTS = 6  # Attempts per embeddings request while rate limited
+EMBEDDING_RETRY_MAX_WAIT = 60  # Upper bound in seconds on the backoff between attempts
+
+# HTTP connection pool settings
+HTTP_POOL_CONNECTIONS = 32  # Hosts with a cached connection pool
+HTTP_POOL_MAXSIZE = 64  # Connections kept per host
 
 # Search settings
+INDEX_CHECK_TTL = 300  # Seconds to trust a previous index existence check
+INDEX_UPLOAD_WORKERS = 8  # Document batches uploaded concurrently
+INDEX_WINDOW_SIZE = 1000  # Chunks buffered before they are sent to the index
+SEARCH_API_VERSION = "2024-07-01"  # REST API version for direct document uploads
 TOP_K_RESULTS = 5
+VECTOR_SEARCH_K = max(TOP_K_RESULTS * 3, 20)  # Nearest neighbors considered before taking the top results
 SIMILARITY_THRESHOLD = 0.7
 
 # System prompts
@@ -8,16 +8,18 @@ Usage:
 """
 import os
 import sys
+import collections
 import argparse
 import logging
-from pathlib import Path
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
 
+from config.settings import get_settings
 from src.utilities.helpers import setup_logging, print_colored, validate_file_exists
 from src.ingestion.document_loader import DocumentLoader
 from src.ingestion.text_processor import TextProcessor
-from src.ingestion.embeddings import EmbeddingGenerator
-from src.azure.blob_storage import BlobStorageService
+from src.ingestion.embeddings import get_embedding_generator
+from src.azure.blob_storage import get_blob_service
 from src.search.vector_store import VectorStore
 
 def parse_args():
@@ -31,23 +33,22 @@ def parse_args():
     
     # Add optional arguments
     parser.add_argument('--skip-upload', action='store_true', help="Skip uploading to blob storage")
+    parser.add_argument('--workers', '-w', type=int, default=get_settings().ingest_workers, help="Number of files to ingest concurrently")
+    parser.add_argument('--recreate-index', action='store_true', help="Drop and rebuild the search index before ingesting")
     parser.add_argument('--verbose', '-v', action='store_true', help="Enable verbose logging")
     
     return parser.parse_args()
 
-def ingest_file(file_path: str, skip_upload: bool = False) -> Dict[str, Any]:
+def _load_and_chunk(file_path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     """
-    Ingest a single document file.
+    Load a document file and split its text into chunks.
     
     Args:
         file_path: Path to the document file
-        skip_upload: Whether to skip uploading to blob storage
         
     Returns:
-        Dictionary with ingestion metadata
+        Tuple of the loaded document and its chunks
     """
-    print_colored(f"Ingesting file: {file_path}", "cyan")
-    
     # 1. Load the document
     document_loader = DocumentLoader()
     document = document_loader.load_document(file_path)
@@ -58,21 +59,129 @@ def ingest_file(file_path: str, skip_upload: bool = False) -> Dict[str, Any]:
     document_chunks = text_processor.process_document(document)
     print_colored(f"Created {len(document_chunks)} text chunks", "green")
     
-    # 3. Generate embeddings
-    embedding_generator = EmbeddingGenerator()
-    document_chunks_with_embeddings = embedding_generator.generate_embeddings(document_chunks)
-    print_colored("Generated embeddings for all chunks", "green")
+    return document, document_chunks
+
+def _load_pages(file_path: str) -> Dict[str, Any]:
+    """
+    Load a document file and read all of its page texts.
+    
+    Args:
+        file_path: Path to the document file
+        
+    Returns:
+        Document dictionary with a list of page texts
+    """
+    document = DocumentLoader.load_document(file_path)
+    document["pages"] = list(document["pages"])
+    print_colored(f"Loaded document: {document['source']}", "green")
+    return document
+
+def _upload_file(file_path: str) -> Dict[str, str]:
+    """
+    Upload a document file to blob storage.
+    
+    Args:
+        file_path: Path to the document file
+        
+    Returns:
+        Dictionary with blob metadata
+    """
+    blob_service = get_blob_service()
+    blob_metadata = blob_service.upload_file(file_path)
+    print_colored(f"Uploaded to blob storage: {blob_metadata['blob_name']}", "green")
+    return blob_metadata
+
+def _run_concurrently(func: Callable[[str], Any], file_paths: List[str], workers: int,
+                      timeout: Optional[float] = None) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Run a per-file step on a thread pool.
+    
+    The timeout only limits how long this step waits for results. Files
+    still running when it expires are reported as failed, but their threads
+    can't be stopped: they keep running in the background, and the
+    interpreter waits for them before it exits.
     
-    # 4. Upload to blob storage (unless skipped)
+    Args:
+        func: Function taking a file path
+        file_paths: Paths of the files to process
+        workers: Maximum number of files to process at once
+        timeout: Optional seconds to wait for the whole step
+        
+    Returns:
+        Tuple of results and error messages, both keyed by file path
+    """
+    outputs = {}
+    errors = {}
+    timed_out = False
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(file_paths))))
+    try:
+        futures = {executor.submit(func, file_path): file_path for file_path in file_paths}
+        
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                file_path = futures[future]
+                try:
+                    outputs[file_path] = future.result()
+                except Exception as e:
+                    print_colored(f"Error ingesting {file_path}: {str(e)}", "red")
+                    errors[file_path] = str(e)
+        except TimeoutError:
+            timed_out = True
+            for future, file_path in futures.items():
+                if not future.done():
+                    print_colored(f"Timed out ingesting {file_path}", "red")
+                    errors[file_path] = f"Not finished within {timeout} seconds; it may still complete in the background"
+    finally:
+        # On timeout, stop waiting for running tasks and drop the ones not
+        # yet started
+        executor.shutdown(wait=not timed_out, cancel_futures=True)
+    
+    return outputs, errors
+
+def _drain_chunks(chunks_by_path: Dict[str, List[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the chunks of every file, releasing each file's chunks once consumed.
+    
+    Args:
+        chunks_by_path: Lists of chunks keyed by file path; emptied as it is consumed
+        
+    Yields:
+        Document chunks, file by file
+    """
+    while chunks_by_path:
+        _, document_chunks = chunks_by_path.popitem()
+        # Pop from the end of the reversed list so that each chunk is freed
+        # as soon as the consumer is done with it
+        document_chunks.reverse()
+        while document_chunks:
+            yield document_chunks.pop()
+
+def ingest_file(file_path: str, skip_upload: bool = False) -> Dict[str, Any]:
+    """
+    Ingest a single document file.
+    
+    Args:
+        file_path: Path to the document file
+        skip_upload: Whether to skip uploading to blob storage
+        
+    Returns:
+        Dictionary with ingestion metadata
+    """
+    print_colored(f"Ingesting file: {file_path}", "cyan")
+    
+    # 1-2. Load the document and chunk the text
+    document, document_chunks = _load_and_chunk(file_path)
+    
+    # 3. Upload to blob storage (unless skipped)
     if not skip_upload:
-        blob_service = BlobStorageService()
-        blob_metadata = blob_service.upload_file(file_path)
-        print_colored(f"Uploaded to blob storage: {blob_metadata['blob_name']}", "green")
+        _upload_file(file_path)
     
-    # 5. Store in vector index
+    # 4-5. Generate embeddings and store them in the vector index as they arrive
+    embedding_generator = get_embedding_generator()
     vector_store = VectorStore()
-    vector_store.ingest_documents(document_chunks_with_embeddings)
-    print_colored("Indexed in vector store", "green")
+    vector_store.ingest_documents(embedding_generator.iter_embedded_chunks(document_chunks))
+    print_colored("Embedded and indexed all chunks in vector store", "green")
     
     return {
         "file": document["source"],
@@ -80,13 +189,19 @@ def ingest_file(file_path: str, skip_upload: bool = False) -> Dict[str, Any]:
         "status": "success"
     }
 
-def ingest_directory(dir_path: str, skip_upload: bool = False) -> List[Dict[str, Any]]:
+def ingest_directory(dir_path: str, skip_upload: bool = False, workers: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Ingest all supported documents in a directory.
     
+    Files are loaded and uploaded concurrently on a thread pool and chunked
+    in parallel worker processes. Chunks from all files are embedded together
+    so that embedding requests are filled up to the batch size regardless of
+    file boundaries.
+    
     Args:
         dir_path: Path to the directory
         skip_upload: Whether to skip uploading to blob storage
+        workers: Maximum number of files to process at once (default: the ingest_workers setting)
         
     Returns:
         List of dictionaries with ingestion metadata
@@ -98,30 +213,94 @@ def ingest_directory(dir_path: str, skip_upload: bool = False) -> List[Dict[str,
         print_colored(f"Error: Directory '{dir_path}' does not exist.", "red")
         return []
     
-    # Get all supported files in directory
-    supported_extensions = ['.pdf', '.docx', '.doc', '.txt', '.md']
-    files = []
+    # Get all supported files in directory with a single walk of the tree
+    supported_extensions = frozenset(['.pdf', '.docx', '.doc', '.txt', '.md'])
+    file_paths = []
     
-    for ext in supported_extensions:
-        files.extend(list(Path(dir_path).glob(f"**/*{ext}")))
+    for root, _, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[1].lower() in supported_extensions:
+                file_paths.append(os.path.join(root, file_name))
     
-    if not files:
+    if not file_paths:
         print_colored(f"No supported documents found in '{dir_path}'", "yellow")
         return []
+    settings = get_settings()
+    workers = workers or settings.ingest_workers
+    
+    # 1. Load every file
+    documents, errors = _run_concurrently(_load_pages, file_paths, workers, settings.ingest_stage_timeout)
+    
+    # 2. Chunk the documents in worker processes and regroup the chunks by
+    # file; only each file's source and chunk count are kept for the results
+    prepared = {}
+    chunks_by_path = {}
+    try:
+        chunks_by_path = {file_path: [] for file_path in documents}
+        for chunk in TextProcessor.process_documents(list(documents.values()), workers):
+            chunks_by_path[chunk["path"]].append(chunk)
+        prepared = {
+            file_path: {"source": documents[file_path]["source"], "chunks": len(chunks_by_path[file_path])}
+            for file_path in documents
+        }
+        print_colored(f"Created {sum(len(chunks) for chunks in chunks_by_path.values())} text chunks", "green")
+    except Exception as e:
+        print_colored(f"Error chunking documents: {str(e)}", "red")
+        errors.update({file_path: str(e) for file_path in documents})
+        chunks_by_path = {}
+    
+    # The page texts aren't needed once the documents are chunked
+    del documents
+    
+    # 3. Upload to blob storage (unless skipped)
+    if not skip_upload and prepared:
+        _, upload_errors = _run_concurrently(_upload_file, list(prepared), workers, settings.ingest_stage_timeout)
+        for file_path, error in upload_errors.items():
+            errors[file_path] = error
+            del prepared[file_path]
+            del chunks_by_path[file_path]
     
-    # Ingest each file
-    results = []
-    for file_path in files:
+    # 4-5. Generate embeddings for the chunks of all files together and store
+    # them in the vector index window by window as they are embedded
+    if prepared:
+        all_chunks = _drain_chunks(chunks_by_path)
+        indexed_counts = collections.Counter()
+        
+        def count_indexed(window: List[Dict[str, Any]]) -> None:
+            indexed_counts.update(chunk["path"] for chunk in window)
+        
         try:
-            result = ingest_file(str(file_path), skip_upload)
-            results.append(result)
+            vector_store = VectorStore()
+            chunk_count = vector_store.ingest_documents(
+                get_embedding_generator().iter_embedded_chunks(all_chunks),
+                on_window=count_indexed
+            )
+            print_colored(f"Embedded and indexed {chunk_count} chunks in vector store", "green")
         except Exception as e:
-            print_colored(f"Error ingesting {file_path}: {str(e)}", "red")
-            results.append({
-                "file": str(file_path),
-                "status": "error",
-                "error": str(e)
-            })
+            print_colored(f"Error embedding or indexing documents: {str(e)}", "red")
+            # Files whose chunks all reached the index before the failure
+            # are still ingested
+            failed = [file_path for file_path, summary in prepared.items() if indexed_counts[file_path] < summary["chunks"]]
+            for file_path in failed:
+                errors[file_path] = str(e)
+                del prepared[file_path]
+    
+    results = [
+        {
+            "file": summary["source"],
+            "chunks": summary["chunks"],
+            "status": "success"
+        }
+        for summary in prepared.values()
+    ]
+    results.extend(
+        {
+            "file": file_path,
+            "status": "error",
+            "error": error
+        }
+        for file_path, error in errors.items()
+    )
     
     return results
 
@@ -137,6 +316,10 @@ def main():
     print_colored("Starting document ingestion...", "blue", bold=True)
     
     try:
+        if args.recreate_index:
+            VectorStore().recreate_index()
+            print_colored("Recreated search index", "yellow")
+        
         # Process file or directory based on arguments
         if args.file:
             if validate_file_exists(args.file):
@@ -147,7 +330,7 @@ def main():
                     print_colored(f"❌ Failed to ingest {result['file']}", "red", bold=True)
         
         elif args.dir:
-            results = ingest_directory(args.dir, args.skip_upload)
+            results = ingest_directory(args.dir, args.skip_upload, args.workers)
             
             # Print summary
             success_count = sum(1 for r in results if r["status"] == "success")
@@ -3,105 +3,202 @@ Azure AI Search service for vector search.
 """
 import logging
 import json
+import functools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 
+import numpy as np
+import orjson
+import requests
+from cachetools import TTLCache
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
+from azure.search.documents.indexes.models import (
+    SearchIndex,
+    SearchField,
+    SimpleField,
+    SearchableField,
+    SearchFieldDataType,
+    VectorSearch,
+    VectorSearchProfile,
+    HnswAlgorithmConfiguration,
+    HnswParameters,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters
+)
 from azure.search.documents.models import VectorizedQuery
 
 from config.settings import (
-    AZURE_SEARCH_ENDPOINT,
-    AZURE_SEARCH_KEY,
-    AZURE_SEARCH_INDEX_NAME,
+    get_settings,
     EMBEDDING_DIMENSION,
+    INDEX_CHECK_TTL,
+    INDEX_UPLOAD_WORKERS,
+    SEARCH_API_VERSION,
     TOP_K_RESULTS,
+    VECTOR_SEARCH_K,
     SIMILARITY_THRESHOLD
 )
+from src.azure.transport import get_http_session, get_transport, JitteredRetryPolicy
 
 logger = logging.getLogger(__name__)
 
+# Attempts for documents rejected in a partial-success upload response
+RAW_UPLOAD_ATTEMPTS = 3
+
+# Per-document statuses worth retrying: conflicts, throttling and unavailability
+_RETRIABLE_UPLOAD_STATUSES = {409, 422, 429, 503}
+
+@functools.lru_cache(maxsize=1)
+def _build_index_schema() -> SearchIndex:
+    """
+    Build the search index definition once per process.
+    
+    Returns:
+        SearchIndex for the configured index name and HNSW parameters
+    """
+    settings = get_settings()
+    
+    # Define vector search configuration
+    vector_search = VectorSearch(
+        profiles=[
+            VectorSearchProfile(
+                name="vector-profile",
+                algorithm_configuration_name="hnsw-config",
+                compression_name="sq8"
+            )
+        ],
+        algorithms=[
+            HnswAlgorithmConfiguration(
+                name="hnsw-config",
+                parameters=HnswParameters(
+                    m=settings.hnsw_m,
+                    ef_construction=settings.hnsw_ef_construction,
+                    ef_search=settings.hnsw_ef_search,
+                    metric="cosine"
+                )
+            )
+        ],
+        # Store vectors as int8 for the HNSW graph; candidates are reranked
+        # with the full-precision vectors to recover recall
+        compressions=[
+            ScalarQuantizationCompression(
+                compression_name="sq8",
+                rerank_with_original_vectors=True,
+                parameters=ScalarQuantizationParameters(quantized_data_type="int8")
+            )
+        ]
+    )
+    
+    # Define fields for the search index
+    fields = [
+        SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+        SimpleField(name="chunk_id", type=SearchFieldDataType.Int32),
+        SearchableField(name="text", type=SearchFieldDataType.String),
+        SimpleField(name="source", type=SearchFieldDataType.String, filterable=True),
+        SimpleField(name="path", type=SearchFieldDataType.String),
+        SimpleField(name="document_type", type=SearchFieldDataType.String, filterable=True),
+        SimpleField(name="created", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
+        SimpleField(name="modified", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
+        SearchField(
+            name="embedding",
+            type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+            searchable=True,
+            vector_search_dimensions=EMBEDDING_DIMENSION,
+            vector_search_profile_name="vector-profile"
+        )
+    ]
+    
+    return SearchIndex(name=settings.azure_search_index_name, fields=fields, vector_search=vector_search)
+
+def _with_list_embedding(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the document with an ndarray embedding converted to a list for JSON encoding."""
+    embedding = document.get("embedding")
+    if isinstance(embedding, np.ndarray):
+        return {**document, "embedding": embedding.tolist()}
+    return document
+
 class AzureSearchService:
     """Service for Azure AI Search operations."""
     
+    # Index names known to exist, shared by all instances in the process
+    _index_verified = TTLCache(maxsize=16, ttl=INDEX_CHECK_TTL)
+    _index_verified_lock = threading.Lock()
+    
     def __init__(self):
         """Initialize Azure AI Search clients."""
-        self.endpoint = AZURE_SEARCH_ENDPOINT
-        self.key = AZURE_SEARCH_KEY
-        self.index_name = AZURE_SEARCH_INDEX_NAME
+        settings = get_settings()
+        self.endpoint = settings.azure_search_endpoint
+        self.key = settings.azure_search_key
+        self.index_name = settings.azure_search_index_name
+        self.hnsw_ef_search = settings.hnsw_ef_search
         self.credential = AzureKeyCredential(self.key)
         
         # Clients
         self.index_client = SearchIndexClient(
             endpoint=self.endpoint,
-            credential=self.credential
+            credential=self.credential,
+            transport=get_transport()
         )
         self.search_client = SearchClient(
             endpoint=self.endpoint,
             index_name=self.index_name,
-            credential=self.credential
+            credential=self.credential,
+            transport=get_transport(),
+            retry_policy=JitteredRetryPolicy(retry_total=6, retry_backoff_factor=1.0, retry_backoff_max=60)
         )
+        
+        if TOP_K_RESULTS > self.hnsw_ef_search / 2:
+            logger.warning(
+                f"TOP_K_RESULTS ({TOP_K_RESULTS}) is more than half of HNSW efSearch ({self.hnsw_ef_search}); "
+                "recall may suffer"
+            )
     
     def create_index_if_not_exists(self) -> None:
         """Create the search index if it doesn't exist."""
-        from azure.search.documents.indexes.models import (
-            SearchIndex,
-            SimpleField,
-            SearchableField,
-            SearchFieldDataType,
-            VectorSearch,
-            VectorSearchProfile,
-            HnswAlgorithmConfiguration
-        )
-        
-        # Check if index already exists
-        if self.index_name in [index.name for index in self.index_client.list_indexes()]:
-            logger.info(f"Index '{self.index_name}' already exists")
-            return
-            
-        # Define vector search configuration
-        vector_search = VectorSearch(
-            profiles=[
-                VectorSearchProfile(
-                    name="vector-profile",
-                    algorithm_configuration_name="hnsw-config"
-                )
-            ],
-            algorithms=[
-                HnswAlgorithmConfiguration(
-                    name="hnsw-config",
-                    parameters={
-                        "m": 4,
-                        "efConstruction": 400,
-                        "efSearch": 500,
-                        "metric": "cosine"
-                    }
-                )
-            ]
-        )
+        with AzureSearchService._index_verified_lock:
+            if self.index_name in AzureSearchService._index_verified:
+                return
         
-        # Define fields for the search index
-        fields = [
-            SimpleField(name="id", type=SearchFieldDataType.String, key=True),
-            SimpleField(name="chunk_id", type=SearchFieldDataType.Int32),
-            SearchableField(name="text", type=SearchFieldDataType.String),
-            SimpleField(name="source", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="path", type=SearchFieldDataType.String),
-            SimpleField(name="document_type", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="created", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
-            SimpleField(name="modified", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
-            SimpleField(
-                name="embedding",
-                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
-                vector_search_dimensions=EMBEDDING_DIMENSION,
-                vector_search_profile_name="vector-profile"
+        # Creating or updating is idempotent, so no existence check is needed
+        try:
+            self.index_client.create_or_update_index(_build_index_schema())
+        except HttpResponseError as e:
+            logger.error(
+                f"Could not update index '{self.index_name}' to the configured schema; "
+                f"use --recreate-index to rebuild it: {e}"
             )
-        ]
+            raise
         
-        # Create the index
-        index = SearchIndex(name=self.index_name, fields=fields, vector_search=vector_search)
-        self.index_client.create_index(index)
-        logger.info(f"Created index '{self.index_name}'")
+        logger.info(f"Index '{self.index_name}' ensured")
+        self._mark_index_verified()
+    
+    def recreate_index(self) -> None:
+        """
+        Drop the search index and create it again.
+        
+        HNSW graph parameters can't be changed on an existing index, so this is
+        needed to apply new values. All indexed documents are removed.
+        """
+        try:
+            self.index_client.delete_index(self.index_name)
+            logger.info(f"Deleted index '{self.index_name}'")
+        except ResourceNotFoundError:
+            logger.info(f"Index '{self.index_name}' does not exist")
+        
+        with AzureSearchService._index_verified_lock:
+            AzureSearchService._index_verified.pop(self.index_name, None)
+        
+        self.create_index_if_not_exists()
+    
+    def _mark_index_verified(self) -> None:
+        """Remember that the index exists so later checks skip the REST call."""
+        with AzureSearchService._index_verified_lock:
+            AzureSearchService._index_verified[self.index_name] = True
     
     def index_documents(self, documents: List[Dict[str, Any]]) -> None:
         """
@@ -114,18 +211,91 @@ class AzureSearchService:
             # Make sure index exists
             self.create_index_if_not_exists()
             
-            # Upload documents in batches to avoid size limits
+            # Upload documents in batches to avoid size limits, several at a time
             batch_size = 100
-            for i in range(0, len(documents), batch_size):
-                batch = documents[i:i+batch_size]
-                results = self.search_client.upload_documents(documents=batch)
-                success_count = sum(1 for r in results if r.succeeded)
-                logger.info(f"Indexed {success_count}/{len(batch)} document chunks")
+            batches = [documents[i:i+batch_size] for i in range(0, len(documents), batch_size)]
+            if not batches:
+                return
+            
+            with ThreadPoolExecutor(max_workers=min(INDEX_UPLOAD_WORKERS, len(batches))) as executor:
+                for batch, success_count in zip(batches, executor.map(self._upload_batch, batches)):
+                    logger.info(f"Indexed {success_count}/{len(batch)} document chunks")
                 
         except Exception as e:
             logger.error(f"Error indexing documents: {e}")
             raise
     
+    def _upload_batch(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Upload a single batch of documents.
+        
+        The batch is posted straight to the REST API with orjson-encoded JSON;
+        the SDK's upload_documents is used if that request fails. Only the SDK
+        path needs ndarray embeddings converted to lists.
+        
+        Args:
+            batch: Document chunks to upload in one request
+            
+        Returns:
+            Number of documents indexed successfully
+        """
+        try:
+            return self._bulk_upload_raw(batch)
+        except (requests.RequestException, HttpResponseError) as e:
+            logger.warning(f"Raw document upload failed, retrying through the SDK: {e}")
+            results = self.search_client.upload_documents(documents=[_with_list_embedding(document) for document in batch])
+            return sum(1 for r in results if r.succeeded)
+    
+    def _bulk_upload_raw(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Upload a batch of documents through the REST index endpoint.
+        
+        Documents rejected with a retriable status in a 207 partial-success
+        response are sent again, up to RAW_UPLOAD_ATTEMPTS times.
+        
+        Args:
+            batch: Document chunks to upload in one request
+            
+        Returns:
+            Number of documents indexed successfully
+        """
+        url = f"{self.endpoint.rstrip('/')}/indexes/{self.index_name}/docs/index"
+        headers = {"api-key": self.key, "Content-Type": "application/json"}
+        session = get_http_session()
+        
+        pending = {document["id"]: document for document in batch}
+        success_count = 0
+        
+        for attempt in range(RAW_UPLOAD_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, 2 ** attempt))
+            
+            # ndarray embeddings are written straight from their buffers
+            body = orjson.dumps({
+                "value": [{"@search.action": "upload", **document} for document in pending.values()]
+            }, option=orjson.OPT_SERIALIZE_NUMPY)
+            response = session.post(url, params={"api-version": SEARCH_API_VERSION}, headers=headers, data=body, timeout=60)
+            if response.status_code not in (200, 207):
+                raise HttpResponseError(message=f"Document upload failed with HTTP {response.status_code}: {response.text}")
+            
+            retry = {}
+            for result in orjson.loads(response.content)["value"]:
+                if result["status"]:
+                    success_count += 1
+                elif result.get("statusCode") in _RETRIABLE_UPLOAD_STATUSES:
+                    retry[result["key"]] = pending[result["key"]]
+                else:
+                    logger.warning(f"Failed to index document {result['key']}: {result.get('errorMessage')}")
+            
+            pending = retry
+            if not pending:
+                break
+        
+        if pending:
+            logger.warning(f"Gave up indexing {len(pending)} document chunks after {RAW_UPLOAD_ATTEMPTS} attempts")
+        
+        return success_count
+    
     def vector_search(self, query_vector: List[float], filter_conditions: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Perform vector search using query embedding.
@@ -138,30 +308,48 @@ class AzureSearchService:
             List of search results
         """
         try:
-            vector_query = VectorizedQuery(vector=query_vector, k_nearest_neighbors=TOP_K_RESULTS, fields="embedding")
+            # Search a wider neighborhood for better recall, but only return
+            # the top results over the wire
+            vector_query = VectorizedQuery(vector=query_vector, k_nearest_neighbors=VECTOR_SEARCH_K, fields="embedding")
             
             results = self.search_client.search(
                 search_text=None,
                 vector_queries=[vector_query],
                 filter=filter_conditions,
-                select=["id", "text", "source", "path", "document_type", "@search.score"]
+                select=["id", "text", "source", "path", "document_type", "@search.score"],
+                top=TOP_K_RESULTS
             )
             
+            results = list(results)
+            
+            # Only include results above similarity threshold
+            scores = np.fromiter((result["@search.score"] for result in results), dtype=np.float32, count=len(results))
+            above_threshold = np.nonzero(scores >= SIMILARITY_THRESHOLD)[0]
+            
             search_results = []
-            for result in results:
-                # Only include results above similarity threshold
-                if result["@search.score"] >= SIMILARITY_THRESHOLD:
-                    search_results.append({
-                        "id": result["id"],
-                        "text": result["text"],
-                        "source": result["source"],
-                        "path": result["path"],
-                        "document_type": result["document_type"],
-                        "score": result["@search.score"]
-                    })
+            for i in above_threshold:
+                result = results[i]
+                search_results.append({
+                    "id": result["id"],
+                    "text": result["text"],
+                    "source": result["source"],
+                    "path": result["path"],
+                    "document_type": result["document_type"],
+                    "score": result["@search.score"]
+                })
             
             return search_results
             
         except Exception as e:
             logger.error(f"Error in vector search: {e}")
-            raise
\ No newline at end of file
+            raise
+
+@functools.lru_cache(maxsize=1)
+def get_search_service() -> AzureSearchService:
+    """
+    Get the shared Azure AI Search service for this process.
+    
+    Returns:
+        AzureSearchService instance
+    """
+    return AzureSearchService()
\ No newline at end of file
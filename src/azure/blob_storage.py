@@ -2,13 +2,16 @@
 Azure Blob Storage service for storing document files.
 """
 import os
+import hashlib
 import logging
+import functools
 from typing import Dict, Optional
 
 from azure.storage.blob import BlobServiceClient, ContentSettings
-from azure.core.exceptions import ResourceExistsError
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
 
-from config.settings import AZURE_STORAGE_CONNECTION_STRING, BLOB_CONTAINER_NAME
+from config.settings import get_settings
+from src.azure.transport import get_transport
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +20,13 @@ class BlobStorageService:
     
     def __init__(self):
         """Initialize the Azure Blob Storage client."""
-        self.connection_string = AZURE_STORAGE_CONNECTION_STRING
-        self.container_name = BLOB_CONTAINER_NAME
-        self.blob_service_client = BlobServiceClient.from_connection_string(self.connection_string)
+        settings = get_settings()
+        self.connection_string = settings.azure_storage_connection_string
+        self.container_name = settings.blob_container_name
+        self.blob_service_client = BlobServiceClient.from_connection_string(
+            self.connection_string,
+            transport=get_transport()
+        )
         self._ensure_container_exists()
     
     def _ensure_container_exists(self) -> None:
@@ -47,9 +54,25 @@ class BlobStorageService:
                 blob=file_name
             )
             
-            # Set content type based on file extension
+            # Skip the upload if the blob already holds identical content
+            local_md5 = self._compute_md5(file_path)
+            try:
+                properties = blob_client.get_blob_properties()
+                remote_md5 = properties.content_settings.content_md5
+                if remote_md5 and bytes(remote_md5) == local_md5:
+                    logger.info(f"File '{file_name}' is unchanged in container '{self.container_name}', skipping upload")
+                    return {
+                        "blob_url": blob_client.url,
+                        "container": self.container_name,
+                        "blob_name": file_name
+                    }
+            except ResourceNotFoundError:
+                pass
+            
+            # Set content type based on file extension; the MD5 is stored so
+            # later uploads can be compared against it
             content_type = self._get_content_type(file_path)
-            content_settings = ContentSettings(content_type=content_type)
+            content_settings = ContentSettings(content_type=content_type, content_md5=bytearray(local_md5))
             
             # Upload the file
             with open(file_path, "rb") as data:
@@ -104,6 +127,22 @@ class BlobStorageService:
             logger.error(f"Error deleting blob: {e}")
             raise
     
+    def _compute_md5(self, file_path: str) -> bytes:
+        """
+        Compute the MD5 digest of a file, reading it in 4 MB blocks.
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            MD5 digest bytes
+        """
+        md5 = hashlib.md5()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(4 * 1024 * 1024), b""):
+                md5.update(block)
+        return md5.digest()
+    
     def _get_content_type(self, file_path: str) -> str:
         """
         Get content type based on file extension.
@@ -125,4 +164,14 @@ class BlobStorageService:
             '.csv': 'text/csv'
         }
         
-        return content_types.get(extension, 'application/octet-stream')
\ No newline at end of file
+        return content_types.get(extension, 'application/octet-stream')
+
+@functools.lru_cache(maxsize=1)
+def get_blob_service() -> BlobStorageService:
+    """
+    Get the shared Blob Storage service for this process.
+    
+    Returns:
+        BlobStorageService instance
+    """
+    return BlobStorageService()
\ No newline at end of file
@@ -1,64 +1,276 @@
 """
 Azure OpenAI service for text generation and embeddings.
 """
+import asyncio
+import functools
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional
 
-from openai import AzureOpenAI
+import httpx
+import tiktoken
+from aiolimiter import AsyncLimiter
+from openai import AzureOpenAI, AsyncAzureOpenAI, RateLimitError
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from config.settings import (
-    AZURE_OPENAI_ENDPOINT,
-    AZURE_OPENAI_KEY,
-    AZURE_OPENAI_DEPLOYMENT,
-    AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
-    AZURE_OPENAI_API_VERSION,
+    get_settings,
+    EMBEDDING_RETRY_ATTEMPTS,
+    EMBEDDING_RETRY_MAX_WAIT,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
     SYSTEM_PROMPT
 )
 
 logger = logging.getLogger(__name__)
 
+# Called with the texts and embeddings of each request as it completes
+BatchCallback = Callable[[List[str], List[List[float]]], None]
+
+# Rough characters per token, used to size batches when no tokenizer is available
+_CHARS_PER_TOKEN = 4
+
+_backoff_wait = wait_exponential_jitter(initial=1, max=EMBEDDING_RETRY_MAX_WAIT)
+
+def _wait_for_rate_limit(retry_state: RetryCallState) -> float:
+    """
+    Compute the delay before retrying a rate-limited request.
+    
+    The server's Retry-After header is honored when present; jittered
+    exponential backoff is used otherwise and as a lower bound, so that
+    concurrent requests limited at the same moment do not retry together.
+    
+    Args:
+        retry_state: State of the current tenacity retry loop
+        
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    backoff = _backoff_wait(retry_state)
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    if response is None:
+        return backoff
+    
+    try:
+        if "retry-after-ms" in response.headers:
+            retry_after = float(response.headers["retry-after-ms"]) / 1000
+        else:
+            retry_after = float(response.headers.get("retry-after", 0))
+    except ValueError:
+        # Retry-After may also be an HTTP date, which Azure OpenAI does not send
+        return backoff
+    
+    return min(max(retry_after, backoff), EMBEDDING_RETRY_MAX_WAIT)
+
 class AzureOpenAIService:
     """Service for Azure OpenAI operations."""
     
     def __init__(self):
         """Initialize the Azure OpenAI client."""
+        settings = get_settings()
+        self.endpoint = settings.azure_openai_endpoint
+        self.key = settings.azure_openai_key
+        self.api_version = settings.azure_openai_api_version
         self.client = AzureOpenAI(
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
+            api_key=self.key,
+            api_version=self.api_version,
+            azure_endpoint=self.endpoint,
+            http_client=httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_MAXSIZE,
+                    max_keepalive_connections=HTTP_POOL_CONNECTIONS
+                )
+            )
         )
-        self.deployment = AZURE_OPENAI_DEPLOYMENT
-        self.embedding_deployment = AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+        self.deployment = settings.azure_openai_deployment
+        self.embedding_deployment = settings.azure_openai_embedding_deployment
+        self.batch_size = settings.embedding_batch_size
+        self.max_concurrency = settings.embedding_max_concurrency
+        self.requests_per_minute = settings.embedding_requests_per_minute
+        
+        # Shared by every embedding run so the rate holds across calls. The
+        # bucket refills continuously and holds at most about a second's worth
+        # of requests, so a fresh run can't burst through a minute's budget.
+        # Its clock is the monotonic loop time, so it outlives each event loop.
+        limiter_capacity = max(1.0, self.requests_per_minute / 60)
+        self._embed_limiter = AsyncLimiter(limiter_capacity, limiter_capacity * 60 / self.requests_per_minute)
+        self.max_batch_tokens = settings.embedding_max_batch_tokens
+        self.encoding = self._load_encoding(self.embedding_deployment)
         self.system_prompt = SYSTEM_PROMPT
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings(self, texts: List[str], max_concurrent_batches: Optional[int] = None,
+                            on_batch: Optional[BatchCallback] = None) -> List[List[float]]:
         """
         Generate embeddings for a list of texts.
         
+        Caching is left to callers: EmbeddingGenerator keeps embeddings in a
+        persistent cache and search queries are cached in VectorStore.
+        
         Args:
             texts: List of text strings
+            max_concurrent_batches: Batch requests in flight at once (default: the embedding_max_concurrency setting)
+            on_batch: Optional callback receiving each request's texts and embeddings as soon as it
+                completes, so results can be saved before the whole call succeeds
             
         Returns:
             List of embedding vectors as floats
         """
+        if not texts:
+            return []
+        
         try:
-            # Process in batches to avoid token limits
-            batch_size = 16
-            all_embeddings = []
+            return asyncio.run(self._generate_embeddings_async(texts, max_concurrent_batches, on_batch))
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {e}")
+            raise
+    
+    async def _generate_embeddings_async(self, texts: List[str], max_concurrent_batches: Optional[int] = None,
+                                         on_batch: Optional[BatchCallback] = None) -> List[List[float]]:
+        """
+        Generate embeddings with a bounded number of batch requests in flight.
+        
+        Args:
+            texts: List of text strings
+            max_concurrent_batches: Batch requests in flight at once (default: max_concurrency)
+            on_batch: Optional callback for each completed request
             
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i+batch_size]
-                response = self.client.embeddings.create(
-                    input=batch,
-                    model=self.embedding_deployment
-                )
-                batch_embeddings = [item.embedding for item in response.data]
-                all_embeddings.extend(batch_embeddings)
+        Returns:
+            List of embedding vectors as floats, in the order of the input texts
+        """
+        batches = self._pack_batches(texts)
+        semaphore = asyncio.Semaphore(max_concurrent_batches or self.max_concurrency)
+        
+        # Async HTTP connections are tied to the event loop, so the client lives
+        # only as long as this run. Retries are left to _embed_batch so that
+        # every request passes through the rate limiter and Retry-After wait.
+        client = AsyncAzureOpenAI(
+            api_key=self.key,
+            api_version=self.api_version,
+            azure_endpoint=self.endpoint,
+            max_retries=0
+        )
+        try:
+            batch_embeddings = await asyncio.gather(*[
+                self._embed_batch(client, semaphore, self._embed_limiter, [texts[j] for j in batch_indices], on_batch)
+                for batch_indices in batches
+            ])
+        finally:
+            await client.close()
+        
+        all_embeddings = [None] * len(texts)
+        for batch_indices, embeddings in zip(batches, batch_embeddings):
+            for j, embedding in zip(batch_indices, embeddings):
+                all_embeddings[j] = embedding
+        
+        return all_embeddings
+    
+    def _pack_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Group texts into embedding requests by token count.
+        
+        Texts are sorted longest first so each request holds texts of similar
+        length, and a request is closed once it reaches batch_size texts or
+        adding the next text would exceed max_batch_tokens.
+        
+        Args:
+            texts: List of text strings
             
-            return all_embeddings
+        Returns:
+            List of batches, each a list of indices into texts
+        """
+        token_counts = self._count_tokens(texts)
+        order = sorted(range(len(texts)), key=lambda i: token_counts[i], reverse=True)
+        
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for i in order:
+            if batch and (len(batch) >= self.batch_size or batch_tokens + token_counts[i] > self.max_batch_tokens):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(i)
+            batch_tokens += token_counts[i]
+        if batch:
+            batches.append(batch)
+        
+        return batches
+    
+    @staticmethod
+    def _load_encoding(model: Optional[str]) -> Optional[tiktoken.Encoding]:
+        """
+        Load the tokenizer for the embedding model.
+        
+        Azure deployments are often named freely, so a name tiktoken doesn't
+        know falls back to cl100k_base, the encoding of the OpenAI embedding
+        models.
+        
+        Args:
+            model: Embedding deployment or model name
             
+        Returns:
+            Tokenizer, or None if tiktoken can't load one
+        """
+        try:
+            if model:
+                try:
+                    return tiktoken.encoding_for_model(model)
+                except KeyError:
+                    pass
+            return tiktoken.get_encoding("cl100k_base")
         except Exception as e:
-            logger.error(f"Error generating embeddings: {e}")
-            raise
+            # tiktoken downloads its vocabulary files on first use
+            logger.warning(f"Could not load a tokenizer, estimating token counts from text length: {e}")
+            return None
+    
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens of each text.
+        
+        Args:
+            texts: List of text strings
+            
+        Returns:
+            Token count of each text, estimated from its length if no tokenizer is loaded
+        """
+        if self.encoding is None:
+            return [len(text) // _CHARS_PER_TOKEN + 1 for text in texts]
+        
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=())]
+    
+    async def _embed_batch(self, client: AsyncAzureOpenAI, semaphore: asyncio.Semaphore, limiter: AsyncLimiter,
+                           batch: List[str], on_batch: Optional[BatchCallback] = None) -> List[List[float]]:
+        """
+        Embed a single batch, backing off while rate limited.
+        
+        Args:
+            client: Async Azure OpenAI client
+            semaphore: Semaphore bounding the number of concurrent requests
+            limiter: Limiter keeping requests under the deployment's rate limit
+            batch: Texts to embed in one request
+            on_batch: Optional callback receiving the batch's texts and embeddings
+            
+        Returns:
+            List of embedding vectors for the batch
+        """
+        async with semaphore:
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(RateLimitError),
+                wait=_wait_for_rate_limit,
+                stop=stop_after_attempt(EMBEDDING_RETRY_ATTEMPTS),
+                reraise=True
+            ):
+                with attempt:
+                    # Every attempt, including retries, counts against the limit
+                    async with limiter:
+                        response = await client.embeddings.create(
+                            input=batch,
+                            model=self.embedding_deployment
+                        )
+        
+        embeddings = [item.embedding for item in response.data]
+        if on_batch is not None:
+            on_batch(batch, embeddings)
+        
+        return embeddings
     
     def generate_answer(self, query: str, context: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -93,8 +305,10 @@ class AzureOpenAIService:
             
             # Create sources list without duplicates
             sources = []
+            seen_sources = set()
             for item in context:
-                if item["source"] not in [src["source"] for src in sources]:
+                if item["source"] not in seen_sources:
+                    seen_sources.add(item["source"])
                     sources.append({
                         "source": item["source"],
                         "path": item["path"]
@@ -107,4 +321,14 @@ class AzureOpenAIService:
             
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
-            raise
\ No newline at end of file
+            raise
+
+@functools.lru_cache(maxsize=1)
+def get_openai_service() -> AzureOpenAIService:
+    """
+    Get the shared Azure OpenAI service for this process.
+    
+    Returns:
+        AzureOpenAIService instance
+    """
+    return AzureOpenAIService()
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Shared HTTP transport for Azure SDK clients.
+"""
+import functools
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.policies import RetryPolicy
+from azure.core.pipeline.transport import RequestsTransport
+
+from config.settings import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+
+@functools.lru_cache(maxsize=1)
+def get_http_session() -> requests.Session:
+    """
+    Get the process-wide HTTP session with a pooled HTTPS adapter.
+    
+    Returns:
+        Shared requests session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    return session
+
+@functools.lru_cache(maxsize=1)
+def get_transport() -> RequestsTransport:
+    """
+    Get the transport shared by all Azure SDK clients.
+    
+    Reusing one connection pool means TCP and TLS setup is paid once per
+    host rather than once per client.
+    
+    Returns:
+        Shared requests-based transport
+    """
+    # The session outlives any single client, so clients must not close it
+    return RequestsTransport(session=get_http_session(), session_owner=False)
+
+class JitteredRetryPolicy(RetryPolicy):
+    """Retry policy with randomized exponential backoff.
+    
+    Concurrent requests that are throttled together (HTTP 429/503) would
+    otherwise all retry at the same moment and be throttled again.
+    """
+    
+    def get_backoff_time(self, settings):
+        """Pick a backoff uniformly between zero and the exponential backoff."""
+        return random.uniform(0, super().get_backoff_time(settings))
\ No newline at end of file
@@ -3,27 +3,34 @@ Document loader for extracting text from various document types.
 """
 import os
 import logging
+import threading
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Any, Dict, Iterator, Optional, List
 
 import PyPDF2
+import pypdfium2 as pdfium
 import docx
 
 logger = logging.getLogger(__name__)
 
+_PDFIUM_LOCK = threading.Lock()
+
 class DocumentLoader:
     """Loads and extracts text from different document types."""
     
     @staticmethod
-    def load_document(file_path: str) -> Dict[str, str]:
+    def load_document(file_path: str) -> Dict[str, Any]:
         """
-        Load text content from a document file.
+        Load a document file.
+        
+        The text is not read up front: "pages" is an iterator that extracts
+        page texts (paragraphs for Word documents) as it is consumed.
         
         Args:
             file_path: Path to the document file
             
         Returns:
-            Dictionary with metadata and text content
+            Dictionary with metadata and an iterator over page texts
         """
         path = Path(file_path)
         
@@ -34,59 +41,100 @@ class DocumentLoader:
         file_extension = path.suffix.lower()
         
         if file_extension == '.pdf':
-            text = DocumentLoader._extract_text_from_pdf(file_path)
+            pages = DocumentLoader._extract_pages_from_pdf(file_path)
         elif file_extension in ['.docx', '.doc']:
-            text = DocumentLoader._extract_text_from_word(file_path)
+            pages = DocumentLoader._extract_pages_from_word(file_path)
         elif file_extension in ['.txt', '.md', '.py', '.json', '.csv']:
-            text = DocumentLoader._extract_text_from_text_file(file_path)
+            pages = DocumentLoader._extract_pages_from_text_file(file_path)
         else:
             raise ValueError(f"Unsupported file type: {file_extension}")
         
         return {
             "source": file_name,
             "path": file_path,
-            "text": text,
+            "pages": pages,
             "type": file_extension.replace('.', ''),
             "created": os.path.getctime(file_path),
             "modified": os.path.getmtime(file_path)
         }
     
     @staticmethod
-    def _extract_text_from_pdf(file_path: str) -> str:
-        """Extract text from PDF file."""
-        text = []
+    def _extract_pages_from_pdf(file_path: str) -> Iterator[str]:
+        """Extract text from PDF file page by page using PDFium, falling back to PyPDF2."""
+        # PDFium is not thread-safe, even across documents, so calls into it
+        # are serialized between ingestion threads. The lock is released
+        # between pages so it isn't held while the consumer chunks a page.
+        try:
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(file_path)
+                page_count = len(pdf)
+        except Exception as e:
+            logger.warning(f"PDFium could not open {file_path}, falling back to PyPDF2: {e}")
+            yield from DocumentLoader._extract_pages_from_pdf_pypdf2(file_path)
+            return
+        
+        page_num = 0
+        try:
+            for page_num in range(page_count):
+                with _PDFIUM_LOCK:
+                    page = pdf[page_num]
+                    try:
+                        textpage = page.get_textpage()
+                        try:
+                            text = textpage.get_text_range()
+                        finally:
+                            textpage.close()
+                    finally:
+                        page.close()
+                yield text.replace("\r\n", "\n")
+        except Exception as e:
+            # Continue from the failed page so pages already yielded aren't repeated
+            logger.warning(f"PDFium failed on page {page_num + 1} of {file_path}, falling back to PyPDF2: {e}")
+            yield from DocumentLoader._extract_pages_from_pdf_pypdf2(file_path, start_page=page_num)
+        finally:
+            with _PDFIUM_LOCK:
+                pdf.close()
+    
+    @staticmethod
+    def _extract_pages_from_pdf_pypdf2(file_path: str, start_page: int = 0) -> Iterator[str]:
+        """Extract text from PDF file page by page using PyPDF2."""
         try:
             with open(file_path, 'rb') as file:
                 reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    text.append(page.extract_text())
-            return "\n".join(text)
+                for page in reader.pages[start_page:]:
+                    yield page.extract_text() or ""
         except Exception as e:
             logger.error(f"Error extracting text from PDF {file_path}: {e}")
             raise
     
     @staticmethod
-    def _extract_text_from_word(file_path: str) -> str:
-        """Extract text from Word document."""
+    def _extract_pages_from_word(file_path: str) -> Iterator[str]:
+        """Extract text from Word document paragraph by paragraph."""
         try:
             doc = docx.Document(file_path)
-            text = [paragraph.text for paragraph in doc.paragraphs if paragraph.text]
-            return "\n".join(text)
         except Exception as e:
             logger.error(f"Error extracting text from Word document {file_path}: {e}")
             raise
+        
+        for paragraph in doc.paragraphs:
+            if paragraph.text:
+                yield paragraph.text
     
     @staticmethod
-    def _extract_text_from_text_file(file_path: str) -> str:
-        """Extract text from plain text file."""
+    def _extract_pages_from_text_file(file_path: str) -> Iterator[str]:
+        """Extract text from plain text file as a single page."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except UnicodeDecodeError:
-            # Try alternative encodings if utf-8 fails
-            with open(file_path, 'r', encoding='latin-1') as file:
-                return file.read()
+            # Read once and decode in memory so a non-UTF-8 file isn't read twice
+            raw = Path(file_path).read_bytes()
         except Exception as e:
             logger.error(f"Error extracting text from text file {file_path}: {e}")
-            raise
\ No newline at end of file
+            raise
+        
+        try:
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            # Try alternative encodings if utf-8 fails
+            text = raw.decode('latin-1')
+        
+        # Translate line endings as text-mode open() would
+        yield text.replace('\r\n', '\n').replace('\r', '\n')
\ No newline at end of file
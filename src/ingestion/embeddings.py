@@ -1,77 +1,209 @@
 """
 Generate embeddings for document chunks using Azure OpenAI.
 """
+import os
+import functools
+import hashlib
+import itertools
 import logging
+import sqlite3
+import threading
 import numpy as np
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 
-from openai import AzureOpenAI
-from config.settings import (
-    AZURE_OPENAI_ENDPOINT,
-    AZURE_OPENAI_KEY,
-    AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
-    AZURE_OPENAI_API_VERSION
-)
+from config.settings import get_settings, EMBEDDING_DIMENSION, EMBEDDING_WINDOW_SIZE
+from src.azure.openai_service import get_openai_service
 
 logger = logging.getLogger(__name__)
 
+# Rows looked up per SELECT, below SQLite's bound parameter limit
+_CACHE_LOOKUP_BATCH = 500
+
 class EmbeddingGenerator:
     """Generate embeddings using Azure OpenAI."""
     
-    def __init__(self):
-        """Initialize the Azure OpenAI client."""
-        self.client = AzureOpenAI(
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
-        )
-        self.deployment = AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+    def __init__(self, cache_path: Optional[str] = None, max_concurrent_batches: Optional[int] = None):
+        """
+        Initialize the Azure OpenAI service and the persistent embedding cache.
+        
+        Args:
+            cache_path: SQLite file for cached embeddings (default: the embedding_cache_path setting)
+            max_concurrent_batches: Embedding requests in flight at once; raise it on
+                higher rate-limit tiers (default: the embedding_max_concurrency setting)
+        """
+        self.openai_service = get_openai_service()
+        self.deployment = self.openai_service.embedding_deployment
+        if not self.deployment:
+            # Cached embeddings are keyed by deployment, so there is nothing to
+            # store them under without one
+            raise ValueError("AZURE_OPENAI_EMBEDDING_DEPLOYMENT must be set to generate embeddings")
+        self.api_version = self.openai_service.api_version
+        self.max_concurrent_batches = max_concurrent_batches
+        self.cache_path = cache_path or get_settings().embedding_cache_path
+        self._cache_lock = threading.Lock()
+        self.cache = self._open_cache(self.cache_path)
     
-    def generate_embeddings(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def iter_embedded_chunks(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
         """
-        Generate embeddings for a list of document chunks.
+        Generate embeddings for document chunks, yielding them as they are embedded.
+        
+        Chunks are embedded EMBEDDING_WINDOW_SIZE at a time and yielded as
+        copies with the embedding added, so only one window of embeddings is
+        held at once when the consumer doesn't keep them.
         
         Args:
-            chunks: List of document chunks with text and metadata
+            chunks: Document chunks with text and metadata
             
-        Returns:
-            List of document chunks with embeddings added
+        Yields:
+            Copies of the document chunks with embeddings added
         """
-        texts = [chunk["text"] for chunk in chunks]
+        chunks = iter(chunks)
         
-        try:
-            embeddings = self._get_embeddings(texts)
+        while True:
+            window = list(itertools.islice(chunks, EMBEDDING_WINDOW_SIZE))
+            if not window:
+                return
             
-            # Add embeddings to chunks
-            for i, chunk in enumerate(chunks):
-                chunk["embedding"] = embeddings[i]
+            try:
+                embeddings = self.embed_texts([chunk.get("embed_text", chunk["text"]) for chunk in window])
+            except Exception as e:
+                logger.error(f"Error generating embeddings: {e}")
+                raise
             
-            return chunks
-        except Exception as e:
-            logger.error(f"Error generating embeddings: {e}")
-            raise
+            for chunk, embedding in zip(window, embeddings):
+                embedded_chunk = {key: value for key, value in chunk.items() if key != "embed_text"}
+                embedded_chunk["embedding"] = embedding
+                yield embedded_chunk
     
-    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
         """
         Get embeddings for a list of texts using Azure OpenAI.
         
+        Embeddings from earlier runs are read from the persistent cache; only
+        texts not found there are sent to Azure OpenAI, each distinct text
+        once. New embeddings are written to the cache as each request
+        completes, so an interrupted ingestion resumes from the last finished
+        request instead of re-embedding everything.
+        
         Args:
             texts: List of text strings
             
         Returns:
-            List of embedding vectors as floats
+            Matrix of embeddings with one float32 row per text
         """
-        # Process in batches to avoid token limits
-        batch_size = 16
-        all_embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            response = self.client.embeddings.create(
-                input=batch,
-                model=self.deployment
+        if not texts:
+            return np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+        
+        keys = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+        cached = self._load_cached(keys)
+        
+        # Repeated texts such as headers, footers and disclaimers are embedded
+        # once; the dictionary keeps the first occurrence of each in order
+        uncached = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in uncached:
+                uncached[key] = text
+        
+        if uncached:
+            # Batching and concurrent submission are handled by the service
+            new_embeddings = self.openai_service.generate_embeddings(
+                list(uncached.values()),
+                self.max_concurrent_batches,
+                on_batch=self._store_batch
             )
-            batch_embeddings = [item.embedding for item in response.data]
-            all_embeddings.extend(batch_embeddings)
+            
+            for key, embedding in zip(uncached, new_embeddings):
+                cached[key] = np.asarray(embedding, dtype=np.float32)
+        
+        logger.debug(f"Embedding cache: {len(texts)} texts, {len(uncached)} distinct texts not embedded before")
+        
+        return np.stack([cached[key] for key in keys])
+    
+    def _open_cache(self, cache_path: str) -> sqlite3.Connection:
+        """
+        Open the embedding cache database, creating it if needed.
         
-        return all_embeddings
\ No newline at end of file
+        Args:
+            cache_path: Path to the SQLite file
+            
+        Returns:
+            SQLite connection
+        """
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        # Several ingestion threads may share the connection, so access is
+        # serialized with a lock rather than tied to the creating thread
+        connection = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "hash BLOB NOT NULL, model TEXT NOT NULL, api_version TEXT NOT NULL, vec BLOB NOT NULL, "
+            "PRIMARY KEY (hash, model, api_version))"
+        )
+        connection.commit()
+        return connection
+    
+    def _load_cached(self, keys: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Look up cached embeddings for the current deployment.
+        
+        Args:
+            keys: SHA-256 digests of the texts
+            
+        Returns:
+            Dictionary mapping each cached digest to its float32 vector
+        """
+        unique_keys = list(set(keys))
+        cached = {}
+        
+        with self._cache_lock:
+            for i in range(0, len(unique_keys), _CACHE_LOOKUP_BATCH):
+                batch = unique_keys[i:i+_CACHE_LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.cache.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND api_version = ? AND hash IN ({placeholders})",
+                    [self.deployment, self.api_version, *batch]
+                )
+                for key, vec in rows:
+                    cached[key] = np.frombuffer(vec, dtype=np.float32)
+        
+        return cached
+    
+    def _store_batch(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        """
+        Write the embeddings of one completed request to the cache.
+        
+        Args:
+            texts: Texts of the request
+            embeddings: Embedding vectors returned for the texts
+        """
+        self._store_cached({
+            hashlib.sha256(text.encode("utf-8")).digest(): np.asarray(embedding, dtype=np.float32)
+            for text, embedding in zip(texts, embeddings)
+        })
+    
+    def _store_cached(self, vectors: Dict[bytes, np.ndarray]) -> None:
+        """
+        Write embeddings to the cache.
+        
+        Args:
+            vectors: Dictionary mapping text digests to float32 vectors
+        """
+        with self._cache_lock:
+            self.cache.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, model, api_version, vec) VALUES (?, ?, ?, ?)",
+                [(key, self.deployment, self.api_version, vec.tobytes()) for key, vec in vectors.items()]
+            )
+            self.cache.commit()
+
+@functools.lru_cache(maxsize=1)
+def get_embedding_generator() -> EmbeddingGenerator:
+    """
+    Get the shared embedding generator for this process.
+    
+    Returns:
+        EmbeddingGenerator instance
+    """
+    return EmbeddingGenerator()
\ No newline at end of file
@@ -1,36 +1,58 @@
 """
 Text processor for chunking and preparing document text.
 """
+import os
 import re
-import uuid
-from typing import Dict, List, Any
+import itertools
+import numpy as np
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
 
-from config.settings import CHUNK_SIZE, CHUNK_OVERLAP
+from config.settings import get_settings, CHUNK_SIZE, CHUNK_OVERLAP, PARALLEL_CHUNKING_MIN_CHARS
+
+# Characters after a chunk's nominal end searched for a sentence boundary
+SENTENCE_SEARCH_WINDOW = 100
+
+# Sentence-ending punctuation followed by whitespace, or a paragraph break
+_SENTENCE_END_RE = re.compile(r'[.!?]\s|\n\n')
+
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+# Only spaces and tabs; collapsing newlines too would erase the paragraph
+# breaks that _find_sentence_end looks for
+_WHITESPACE_RE = re.compile(r'[ \t]{2,}')
 
 class TextProcessor:
     """Process and chunk document text for embeddings."""
     
     @staticmethod
-    def process_document(document: Dict[str, str]) -> List[Dict[str, Any]]:
+    def process_document(document: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Process a document by chunking its text content.
         
+        Pages are chunked as they are read, so the full text of a large
+        document is never held in memory. Chunk ids are random 128-bit hex
+        strings taken from a single os.urandom call per document.
+        
         Args:
-            document: Document dictionary with metadata and text
+            document: Document dictionary with metadata and page texts
             
         Returns:
             List of document chunks with metadata
         """
-        chunks = TextProcessor._chunk_text(document["text"])
+        chunks = list(TextProcessor._chunk_pages(document["pages"]))
+        id_bytes = os.urandom(16 * len(chunks))
         
         # Create document chunks with metadata
         document_chunks = []
         for i, chunk_text in enumerate(chunks):
-            chunk_id = str(uuid.uuid4())
+            chunk_id = id_bytes[i*16:(i+1)*16].hex()
             document_chunks.append({
                 "id": chunk_id,
                 "chunk_id": i,
                 "text": chunk_text,
+                # Prefixing the source ties chunks that don't mention their
+                # subject to the rest of the document in embedding space
+                "embed_text": f"[{document['source']}] {chunk_text}",
                 "source": document["source"],
                 "path": document["path"],
                 "document_type": document.get("type", "unknown"),
@@ -40,69 +62,203 @@ class TextProcessor:
         
         return document_chunks
     
-    @staticmethod
-    def _chunk_text(text: str) -> List[str]:
+    @classmethod
+    def process_documents(cls, documents: List[Dict[str, Any]], workers: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Split text into chunks with overlap.
+        Chunk several documents in parallel worker processes.
+        
+        Documents are sent to the workers by pickling, so their page iterators
+        are read into lists first. When there is too little text to repay
+        starting worker processes, the documents are chunked in-process
+        instead. Chunks of each document stay in order, but documents are
+        returned in the order they finish.
         
         Args:
-            text: The document text to chunk
+            documents: Document dictionaries with metadata and page texts
+            workers: Number of worker processes (default: the ingest_workers setting)
             
         Returns:
-            List of text chunks
+            List of document chunks with metadata
+        """
+        workers = min(workers or get_settings().ingest_workers, len(documents))
+        if workers <= 1:
+            return [chunk for document in documents for chunk in cls.process_document(document)]
+        
+        documents = [{**document, "pages": list(document["pages"])} for document in documents]
+        total_chars = sum(len(page) for document in documents for page in document["pages"])
+        if total_chars < PARALLEL_CHUNKING_MIN_CHARS:
+            return [chunk for document in documents for chunk in cls.process_document(document)]
+        
+        # One pool serves every document; each worker gets several tasks so
+        # the load stays balanced while IPC is still amortized
+        chunksize = max(1, len(documents) // (workers * 4))
+        with Pool(workers) as pool:
+            return list(itertools.chain.from_iterable(
+                pool.imap_unordered(cls.process_document, documents, chunksize=chunksize)
+            ))
+    
+    @staticmethod
+    def _chunk_pages(pages: Iterable[str]) -> Iterator[str]:
+        """
+        Split a stream of page texts into chunks with overlap.
+        
+        The result is the same as chunking the pages joined with newlines, but
+        only the text not yet emitted as a chunk is kept in a rolling buffer,
+        and each page is normalized only where it joins that buffer.
+        
+        Args:
+            pages: Page texts in document order
+            
+        Yields:
+            Text chunks
         """
-        if not text:
-            return []
+        buffer = ""
+        separator = ""
+        # Length of the buffer when it was last scanned for chunks
+        scanned = 0
+        
+        for page in pages:
+            buffer = TextProcessor._normalize_appended(buffer, separator + page)
+            separator = "\n"
+            
+            # Scan only once enough new text has built up to emit a chunk, so
+            # short pages such as Word paragraphs don't each cost a scan
+            if len(buffer) - scanned <= CHUNK_SIZE + SENTENCE_SEARCH_WINDOW:
+                continue
             
-        # Normalize line breaks and remove excessive whitespace
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        text = re.sub(r'\s{2,}', ' ', text)
+            next_start = 0
+            for start, end in TextProcessor._chunk_spans(buffer, final=False):
+                yield buffer[start:end]
+                next_start = end - CHUNK_OVERLAP
+            buffer = buffer[next_start:]
+            scanned = len(buffer)
         
-        # Simple chunking by character count with overlap
-        chunks = []
-        start = 0
+        for start, end in TextProcessor._chunk_spans(buffer):
+            yield buffer[start:end]
+    
+    @staticmethod
+    def _chunk_spans(text: str, final: bool = True) -> Iterator[Tuple[int, int]]:
+        """
+        Find the offsets of the chunks of normalized text.
         
-        while start < len(text):
-            # Find a good breakpoint near CHUNK_SIZE
-            end = start + CHUNK_SIZE
+        Args:
+            text: Normalized text
+            final: Whether the text is complete. If not, only chunks whose
+                sentence search window lies entirely in the text are produced,
+                so text appended later can't change their break.
             
-            if end >= len(text):
+        Yields:
+            Tuples of a chunk's start and end offset
+        """
+        if final:
+            # Short documents and short remainders fit in a single chunk
+            if len(text) <= CHUNK_SIZE:
+                if text:
+                    yield 0, len(text)
+                return
+        elif len(text) <= CHUNK_SIZE + SENTENCE_SEARCH_WINDOW:
+            return
+        
+        boundaries = TextProcessor._sentence_boundaries(text)
+        start = 0
+        while start < len(text):
+            if final and start + CHUNK_SIZE >= len(text):
                 # Last chunk
-                chunks.append(text[start:])
-                break
-                
-            # Try to find sentence boundary for cleaner breaks
-            sentence_end = TextProcessor._find_sentence_end(text, end)
-            if sentence_end > start:  # Ensure we don't create empty chunks
-                chunks.append(text[start:sentence_end])
-                start = sentence_end - CHUNK_OVERLAP
-            else:
-                # Fall back to word boundary if no sentence boundary found
-                word_end = TextProcessor._find_word_end(text, end)
-                chunks.append(text[start:word_end])
-                start = word_end - CHUNK_OVERLAP
-                
-        return chunks
+                yield start, len(text)
+                return
+            if not final and len(text) - start <= CHUNK_SIZE + SENTENCE_SEARCH_WINDOW:
+                return
+            
+            end = TextProcessor._chunk_end(text, start, boundaries)
+            yield start, end
+            start = end - CHUNK_OVERLAP
     
     @staticmethod
-    def _find_sentence_end(text: str, position: int) -> int:
-        """Find the nearest sentence end after the given position."""
+    def _normalize(text: str) -> str:
+        """Collapse runs of blank lines and of spaces and tabs."""
+        text = _BLANK_LINES_RE.sub('\n\n', text)
+        text = _WHITESPACE_RE.sub(' ', text)
+        return text
+    
+    @staticmethod
+    def _normalize_appended(text: str, addition: str) -> str:
+        """
+        Append text to normalized text, normalizing only what the addition affects.
+        
+        Args:
+            text: Normalized text
+            addition: Text to append
+            
+        Returns:
+            The same result as normalizing the concatenation
+        """
+        # Whitespace runs end at the last other character, so only the
+        # trailing whitespace of the normalized text can merge with the addition
+        seam = len(text.rstrip(" \t\n"))
+        return text[:seam] + TextProcessor._normalize(text[seam:] + addition)
+    
+    @staticmethod
+    def _sentence_boundaries(text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find all sentence ends in the text in a single pass.
+        
+        Args:
+            text: Normalized text
+            
+        Returns:
+            Tuple of the sorted start and end offsets of the sentence ends
+        """
+        matches = list(_SENTENCE_END_RE.finditer(text))
+        starts = np.fromiter((match.start() for match in matches), dtype=np.int64, count=len(matches))
+        ends = np.fromiter((match.end() for match in matches), dtype=np.int64, count=len(matches))
+        return starts, ends
+    
+    @staticmethod
+    def _chunk_end(text: str, start: int, boundaries: Tuple[np.ndarray, np.ndarray]) -> int:
+        """
+        Find where the chunk starting at the given position ends.
+        
+        Args:
+            text: Normalized text
+            start: Start offset of the chunk
+            boundaries: Sentence ends of the text from _sentence_boundaries
+            
+        Returns:
+            End offset of the chunk
+        """
+        # Find a good breakpoint near CHUNK_SIZE
+        end = start + CHUNK_SIZE
+        
+        # Try to find sentence boundary for cleaner breaks
+        sentence_end = TextProcessor._find_sentence_end(text, end, boundaries)
+        if sentence_end != -1:
+            return sentence_end
+        
+        # Fall back to word boundary if no sentence boundary found
+        return TextProcessor._find_word_end(text, end)
+    
+    @staticmethod
+    def _find_sentence_end(text: str, position: int, boundaries: Tuple[np.ndarray, np.ndarray]) -> int:
+        """Find the nearest sentence end after the given position, or -1 if there is none."""
         # Look for common sentence enders within a window after position
-        search_window = min(position + 100, len(text))
+        search_window = min(position + SENTENCE_SEARCH_WINDOW, len(text))
         
-        for pattern in [r'\.', r'\!', r'\?', r'\n\n']:
-            matches = list(re.finditer(pattern, text[position:search_window]))
-            if matches:
-                return position + matches[0].end()
+        # First sentence end starting at or after position
+        starts, ends = boundaries
+        i = np.searchsorted(starts, position)
+        if i < len(starts) and ends[i] <= search_window:
+            return int(ends[i])
         
-        return position
+        return -1
     
     @staticmethod
     def _find_word_end(text: str, position: int) -> int:
-        """Find the nearest word end after the given position."""
+        """Find the last word end before the given position, within the chunk overlap."""
         if position >= len(text):
             return len(text)
-            
-        # Find next space or fall back to position if none found
-        next_space = text.find(' ', position, min(position + 50, len(text)))
-        return next_space + 1 if next_space != -1 else position
\ No newline at end of file
+        
+        # Snap back to the last whitespace so no word is cut and the chunk
+        # stays within CHUNK_SIZE; cut at position if there is none
+        window_start = position - CHUNK_OVERLAP
+        last_space = max(text.rfind(' ', window_start, position), text.rfind('\n', window_start, position))
+        return last_space + 1 if last_space != -1 else position
\ No newline at end of file
@@ -2,39 +2,84 @@
 Vector store module to handle search operations.
 """
 import logging
-from typing import List, Dict, Any, Optional
+import functools
+import itertools
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
 
-from src.azure.openai_service import AzureOpenAIService
-from src.azure.ai_search import AzureSearchService
+from config.settings import INDEX_WINDOW_SIZE, QUERY_EMBEDDING_CACHE_SIZE
+from src.azure.openai_service import get_openai_service
+from src.azure.ai_search import get_search_service
+from src.ingestion.embeddings import get_embedding_generator
 
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+def _embed_query(query: str) -> Tuple[float, ...]:
+    """
+    Embed a search query, reusing the embedding of a repeated query.
+    
+    Queries missing from memory are looked up in the persistent embedding
+    cache before calling Azure OpenAI.
+    
+    Args:
+        query: The search query
+        
+    Returns:
+        Embedding vector as an immutable tuple, so the cached value can be shared
+    """
+    return tuple(get_embedding_generator().embed_texts([query])[0].tolist())
+
 class VectorStore:
     """Vector store for document retrieval and search."""
     
     def __init__(self):
         """Initialize the vector store services."""
-        self.search_service = AzureSearchService()
-        self.openai_service = AzureOpenAIService()
+        self.search_service = get_search_service()
+        self.openai_service = get_openai_service()
     
-    def ingest_documents(self, document_chunks: List[Dict[str, Any]]) -> None:
+    def ingest_documents(self, document_chunks: Iterable[Dict[str, Any]],
+                         on_window: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> int:
         """
         Ingest document chunks into the vector store.
         
+        Chunks are uploaded INDEX_WINDOW_SIZE at a time as they are consumed,
+        so a generator of embedded chunks is never materialized in full.
+        
         Args:
-            document_chunks: List of document chunks with embeddings
+            document_chunks: Document chunks with embeddings
+            on_window: Optional callback receiving each window of chunks once it is indexed
+            
+        Returns:
+            Number of chunks sent to the index
         """
         try:
             # First, ensure the index exists
             self.search_service.create_index_if_not_exists()
             
             # Then, upload the documents to the index
-            self.search_service.index_documents(document_chunks)
+            document_chunks = iter(document_chunks)
+            count = 0
+            while True:
+                window = list(itertools.islice(document_chunks, INDEX_WINDOW_SIZE))
+                if not window:
+                    return count
+                self.search_service.index_documents(window)
+                count += len(window)
+                if on_window is not None:
+                    on_window(window)
             
         except Exception as e:
             logger.error(f"Error ingesting documents into vector store: {e}")
             raise
     
+    def recreate_index(self) -> None:
+        """Drop and rebuild the search index, removing all indexed documents."""
+        try:
+            self.search_service.recreate_index()
+        except Exception as e:
+            logger.error(f"Error recreating search index: {e}")
+            raise
+    
     def search(self, query: str, filter_conditions: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Search the vector store with a query.
@@ -48,7 +93,7 @@ class VectorStore:
         """
         try:
             # Generate embedding for the query
-            query_embedding = self.openai_service.generate_embeddings([query])[0]
+            query_embedding = list(_embed_query(query))
             
             # Perform vector search
             results = self.search_service.vector_search(query_embedding, filter_conditions)
@@ -11,6 +11,16 @@ from datetime import datetime
 # Initialize colorama for cross-platform colored terminal output
 colorama.init()
 
+_COLOR_MAP = {
+    'red': colorama.Fore.RED,
+    'green': colorama.Fore.GREEN,
+    'yellow': colorama.Fore.YELLOW,
+    'blue': colorama.Fore.BLUE,
+    'magenta': colorama.Fore.MAGENTA,
+    'cyan': colorama.Fore.CYAN,
+    'white': colorama.Fore.WHITE,
+}
+
 def setup_logging(log_level=logging.INFO):
     """
     Set up logging configuration.
@@ -35,18 +45,13 @@ def print_colored(text: str, color: str = 'white', bold: bool = False) -> None:
         color: Color name ('red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white')
         bold: Whether to use bold text
     """
-    color_map = {
-        'red': colorama.Fore.RED,
-        'green': colorama.Fore.GREEN,
-        'yellow': colorama.Fore.YELLOW,
-        'blue': colorama.Fore.BLUE,
-        'magenta': colorama.Fore.MAGENTA,
-        'cyan': colorama.Fore.CYAN,
-        'white': colorama.Fore.WHITE,
-    }
+    # Escape sequences are only useful on a terminal, not in redirected output
+    if not sys.stdout.isatty():
+        print(text)
+        return
     
     style = colorama.Style.BRIGHT if bold else ''
-    color_code = color_map.get(color.lower(), colorama.Fore.WHITE)
+    color_code = _COLOR_MAP.get(color.lower(), colorama.Fore.WHITE)
     
     print(f"{style}{color_code}{text}{colorama.Style.RESET_ALL}")
 
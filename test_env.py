@@ -4,16 +4,16 @@ Environment test script to verify dependencies and Azure services.
 """
 import os
 import sys
-import importlib
+import importlib.util
 import logging
 from dotenv import load_dotenv
 
 def check_module(module_name):
-    """Check if a Python module is installed."""
+    """Check if a Python module is installed without importing it."""
     try:
-        importlib.import_module(module_name)
-        return True
-    except ImportError:
+        return importlib.util.find_spec(module_name) is not None
+    except ModuleNotFoundError:
+        # Raised for a dotted name whose parent package is missing
         return False
 
 def check_azure_env_vars():
@@ -74,13 +74,17 @@ def main():
         "openai",
         "dotenv",
         "PyPDF2",
+        "pypdfium2",
         "docx",
         "tiktoken",
         "langchain",
         "pydantic",
         "numpy",
+        "orjson",
         "tqdm",
-        "colorama"
+        "colorama",
+        "cachetools",
+        "aiolimiter"
     ]
     
     print("\nChecking required packages:")